@@ -5,35 +5,69 @@
 """
 
 import os
-from typing import Optional
+from dataclasses import dataclass, field
+from functools import lru_cache
+from typing import Any, Callable, List, Optional
 
 
+def _split_list(value: str) -> List[str]:
+    """将逗号分隔的环境变量值拆分为列表"""
+    return value.split(',')
+
+
+def _parse_bool(value: str) -> bool:
+    """解析布尔型环境变量值"""
+    return value.lower() == 'true'
+
+
+def _env(name: str, default: str, cast: Callable[[str], Any] = str) -> Any:
+    """
+    声明一个从环境变量读取的配置字段
+    
+    Args:
+        name: 环境变量名
+        default: 环境变量未设置时使用的默认值
+        cast: 将字符串值转换为字段类型的函数
+    
+    Returns:
+        dataclasses.Field: 实例化时读取环境变量的字段
+    """
+    return field(default_factory=lambda: cast(os.getenv(name, default)))
+
+
+@dataclass(frozen=True)
 class Config:
-    """配置管理类"""
+    """配置管理类（实例化后只读）"""
     
-    def __init__(self):
-        # Gemini CLI 路径
-        self.gemini_path: str = os.getenv('GEMINI_PATH', '/opt/homebrew/bin/gemini')
-        
-        # 日志配置
-        self.log_level: str = os.getenv('LOG_LEVEL', 'INFO')
-        self.log_file: str = os.getenv('LOG_FILE', 'proxy.log')
-        self.max_log_size: int = int(os.getenv('MAX_LOG_SIZE', '5242880'))  # 5MB
-        self.log_backup_count: int = int(os.getenv('LOG_BACKUP_COUNT', '5'))
-        
-        # 服务器配置
-        self.host: str = os.getenv('HOST', '127.0.0.1')
-        self.port: int = int(os.getenv('PORT', '7777'))
-        
-        # 请求超时配置
-        self.request_timeout: float = float(os.getenv('REQUEST_TIMEOUT', '60.0'))
-        self.gemini_timeout: float = float(os.getenv('GEMINI_TIMEOUT', '30.0'))
-        
-        # CORS 配置
-        self.cors_allow_origins: list = os.getenv('CORS_ALLOW_ORIGINS', '*').split(',')
-        self.cors_allow_credentials: bool = os.getenv('CORS_ALLOW_CREDENTIALS', 'true').lower() == 'true'
-        self.cors_allow_methods: list = os.getenv('CORS_ALLOW_METHODS', '*').split(',')
-        self.cors_allow_headers: list = os.getenv('CORS_ALLOW_HEADERS', '*').split(',')
+    # Gemini CLI 路径
+    gemini_path: str = _env('GEMINI_PATH', '/opt/homebrew/bin/gemini')
+    # 预启动并等待提示词的 Gemini CLI 进程数，0 表示每个请求单独启动进程
+    gemini_pool_size: int = _env('GEMINI_POOL_SIZE', '0', int)
+    
+    # 日志配置
+    log_level: str = _env('LOG_LEVEL', 'INFO')
+    log_file: str = _env('LOG_FILE', 'proxy.log')
+    max_log_size: int = _env('MAX_LOG_SIZE', '5242880', int)  # 5MB
+    log_backup_count: int = _env('LOG_BACKUP_COUNT', '5', int)
+    log_queue_size: int = _env('LOG_QUEUE_SIZE', '10000', int)  # 后台日志队列上限
+    
+    # 服务器配置
+    host: str = _env('HOST', '127.0.0.1')
+    port: int = _env('PORT', '7777', int)
+    workers: int = _env('WORKERS', '1', int)  # uvicorn 工作进程数
+    # 事件循环与 HTTP 协议实现（auto 时在已安装 uvloop/httptools 的情况下优先使用）
+    event_loop: str = _env('EVENT_LOOP', 'auto')
+    http_impl: str = _env('HTTP_IMPL', 'auto')
+    
+    # 请求超时配置
+    request_timeout: float = _env('REQUEST_TIMEOUT', '60.0', float)
+    gemini_timeout: float = _env('GEMINI_TIMEOUT', '30.0', float)
+    
+    # CORS 配置
+    cors_allow_origins: list = _env('CORS_ALLOW_ORIGINS', '*', _split_list)
+    cors_allow_credentials: bool = _env('CORS_ALLOW_CREDENTIALS', 'true', _parse_bool)
+    cors_allow_methods: list = _env('CORS_ALLOW_METHODS', '*', _split_list)
+    cors_allow_headers: list = _env('CORS_ALLOW_HEADERS', '*', _split_list)
     
     def validate(self) -> None:
         """验证配置的有效性"""
@@ -43,6 +77,9 @@ class Config:
         if self.port < 1 or self.port > 65535:
             raise ValueError(f"Invalid port number: {self.port}")
         
+        if self.workers < 1:
+            raise ValueError(f"Invalid worker count: {self.workers}")
+        
         if self.request_timeout <= 0:
             raise ValueError(f"Invalid request timeout: {self.request_timeout}")
         
@@ -62,10 +99,11 @@ class Config:
         )
 
 
-# 全局配置实例
-config = Config()
+@lru_cache(maxsize=1)
+def get_config() -> Config:
+    """获取全局配置实例，环境变量在进程内只解析一次"""
+    return Config()
 
 
-def get_config() -> Config:
-    """获取全局配置实例"""
-    return config
\ No newline at end of file
+# 全局配置实例
+config = get_config()
\ No newline at end of file
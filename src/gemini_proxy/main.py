@@ -4,12 +4,36 @@
 创建 FastAPI 应用实例，配置中间件和路由。
 """
 
+import asyncio
+from contextlib import asynccontextmanager
+
 from fastapi import FastAPI
 from fastapi.middleware.cors import CORSMiddleware
 
 from .config import config
-from .services.logging_service import log_requests_middleware
+from .services.gemini_service import get_gemini_service
+from .services.logging_service import log_requests_middleware, get_logging_service
 from .routes import health, models, chat
+from .utils.response_utils import load_tokenizer
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    """
+    应用生命周期管理
+    
+    启动时开启后台日志写入任务和 Gemini 预启动进程池，并在线程池中加载
+    token 编码器（可能需要下载 BPE 文件，不能阻塞事件循环）；
+    关闭时终止空闲进程并等待剩余日志落盘。
+    """
+    logging_service = get_logging_service()
+    gemini_service = get_gemini_service()
+    await logging_service.start()
+    await gemini_service.start()
+    await asyncio.to_thread(load_tokenizer)
+    yield
+    await gemini_service.stop()
+    await logging_service.stop()
 
 
 def create_app() -> FastAPI:
@@ -23,7 +47,8 @@ def create_app() -> FastAPI:
     app = FastAPI(
         title="Gemini Proxy",
         description="FastAPI reverse proxy that adapts OpenAI-style requests to a local Gemini CLI",
-        version="0.1.0"
+        version="0.1.0",
+        lifespan=lifespan
     )
     
     # 配置 CORS 中间件
@@ -50,9 +75,20 @@ def create_app() -> FastAPI:
 app = create_app()
 
 
-if __name__ == "__main__":
+def main() -> None:
+    """
+    命令行入口
+    
+    验证配置后使用 uvicorn 启动异步应用，命令行参数可覆盖监听地址和端口。
+    """
+    import argparse
     import uvicorn
     
+    parser = argparse.ArgumentParser(description="Gemini Proxy server")
+    parser.add_argument('--host', default=config.host, help="服务器监听地址")
+    parser.add_argument('--port', type=int, default=config.port, help="服务器监听端口")
+    args = parser.parse_args()
+    
     # 验证配置
     try:
         config.validate()
@@ -63,7 +99,14 @@ if __name__ == "__main__":
     # 启动服务器
     uvicorn.run(
         "src.gemini_proxy.main:app",
-        host=config.host,
-        port=config.port,
+        host=args.host,
+        port=args.port,
+        workers=config.workers,
+        loop=config.event_loop,
+        http=config.http_impl,
         reload=False
-    )
\ No newline at end of file
+    )
+
+
+if __name__ == "__main__":
+    main()
@@ -4,7 +4,8 @@
 定义所有 Pydantic 数据模型，包括请求和响应数据结构。
 """
 
-from pydantic import BaseModel
+from pydantic import BaseModel, StrictBool, model_validator
+from pydantic_core import PydanticCustomError
 from typing import List, Optional, Dict, Any
 
 
@@ -32,9 +33,9 @@ class ChatCompletionUsage(BaseModel):
 class ChatCompletionRequest(BaseModel):
     """聊天补全请求模型"""
     model: str = "gemini-local"
-    messages: List[ChatMessage]
+    messages: Optional[List[ChatMessage]] = None
     prompt: Optional[str] = None
-    stream: Optional[bool] = False
+    stream: Optional[StrictBool] = False
     temperature: Optional[float] = None
     max_tokens: Optional[int] = None
     top_p: Optional[float] = None
@@ -42,6 +43,13 @@ class ChatCompletionRequest(BaseModel):
     presence_penalty: Optional[float] = None
     stop: Optional[List[str]] = None
     user: Optional[str] = None
+    
+    @model_validator(mode='after')
+    def _check_input(self) -> 'ChatCompletionRequest':
+        """messages 和 prompt 至少提供一个"""
+        if not self.messages and not self.prompt:
+            raise PydanticCustomError('missing_input', 'No messages or prompt provided')
+        return self
 
 
 class ChatCompletionResponse(BaseModel):
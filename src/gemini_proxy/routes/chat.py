@@ -5,12 +5,20 @@
 """
 
 import asyncio
-import json
 import time
-import uuid
 from typing import Dict, Any
+
+import orjson
 from fastapi import APIRouter, Request, HTTPException
-from fastapi.responses import StreamingResponse
+
+try:
+    from fastapi.sse import EventSourceResponse
+except ImportError:  # FastAPI < 0.135 没有内置 SSE 响应
+    from fastapi.responses import StreamingResponse
+    
+    class EventSourceResponse(StreamingResponse):
+        """text/event-stream 流式响应"""
+        media_type = 'text/event-stream'
 
 from ..models import ChatCompletionRequest
 from ..services.gemini_service import get_gemini_service
@@ -22,12 +30,29 @@ from ..utils.validation import (
 )
 from ..utils.response_utils import (
     build_chat_completion_response,
-    build_chat_completion_chunk,
-    count_tokens
+    build_chunk_frame_affixes,
+    count_tokens,
+    new_request_id,
+    OrjsonResponse
 )
 from ..utils.cleaning import clean_gemini_output
 
 
+# Gemini CLI 没有产生有效输出时返回的内容
+EMPTY_RESPONSE_TEXT = "I apologize, I couldn't generate a response."
+
+# 超过该长度的输出在线程池中清理，避免阻塞事件循环
+_THREAD_CLEAN_THRESHOLD = 4096
+
+# 流式响应结束事件
+_SSE_DONE = b"data: [DONE]\n\n"
+
+# 流式响应头：禁止缓存，并关闭 Nginx 等反向代理的响应缓冲
+_SSE_HEADERS = {
+    'Cache-Control': 'no-cache',
+    'X-Accel-Buffering': 'no',
+}
+
 router = APIRouter()
 gemini_service = get_gemini_service()
 logging_service = get_logging_service()
@@ -47,9 +72,10 @@ async def chat_completions(request: Request):
         request: FastAPI 请求对象
     
     Returns:
-        StreamingResponse 或 JSONResponse: 流式或非流式响应
+        EventSourceResponse 或 OrjsonResponse: 流式或非流式响应
     """
-    request_id = uuid.uuid4().hex
+    # 复用日志中间件分配的请求ID，使访问日志和应用日志可以关联
+    request_id = getattr(request.state, 'request_id', None) or new_request_id()
     start_time = time.time()
     
     logging_service.log_info(
@@ -57,8 +83,10 @@ async def chat_completions(request: Request):
     )
     
     try:
-        # 解析请求体
-        body = await request.json()
+        # 解析请求体，优先复用日志中间件已解析的结果
+        body = getattr(request.state, 'parsed_body', None)
+        if body is None:
+            body = orjson.loads(await request.body())
     except Exception:
         logging_service.log_error_message(
             f"[REQUEST_ERROR] id={request_id} invalid json"
@@ -74,14 +102,12 @@ async def chat_completions(request: Request):
         )
         raise e
     
-    # 提取提示词
+    # 提取提示词（请求模型已保证 messages 和 prompt 至少有一个非空）
     try:
         if chat_request.messages:
             prompt = extract_prompt_from_messages(chat_request.messages)
-        elif chat_request.prompt:
-            prompt = validate_prompt(chat_request.prompt)
         else:
-            raise HTTPException(status_code=400, detail='No messages or prompt provided')
+            prompt = validate_prompt(chat_request.prompt)
     except HTTPException as e:
         logging_service.log_error_message(
             f"[PROMPT_EXTRACTION_ERROR] id={request_id} detail={e.detail}"
@@ -92,6 +118,53 @@ async def chat_completions(request: Request):
         f"[REQUEST_PROMPT] id={request_id} preview={prompt[:200]}"
     )
     
+    # 处理流式响应：读取到 Gemini CLI 输出后立即转发
+    if chat_request.stream:
+        blocks = gemini_service.execute_stream(prompt, timeout=60.0)
+        # 在返回响应前取得第一块输出，使执行失败仍能以 HTTP 错误返回
+        try:
+            first_block = await blocks.__anext__()
+        except StopAsyncIteration:
+            first_block = EMPTY_RESPONSE_TEXT
+        except HTTPException as e:
+            logging_service.log_error_message(
+                f"[GEMINI_EXECUTION_ERROR] id={request_id} detail={e.detail}"
+            )
+            raise e
+        
+        prefix, suffix = build_chunk_frame_affixes(
+            request_id, chat_request.model, created=int(start_time)
+        )
+        
+        async def event_stream():
+            """生成流式响应事件"""
+            sent = [first_block]
+            part = first_block
+            try:
+                while True:
+                    yield prefix + orjson.dumps(part) + suffix
+                    
+                    try:
+                        part = ' ' + await blocks.__anext__()
+                    except StopAsyncIteration:
+                        break
+                    sent.append(part)
+            finally:
+                await blocks.aclose()
+            
+            # 发送完成事件
+            yield _SSE_DONE
+            
+            elapsed = time.time() - start_time
+            # token 数只用于日志，流式响应结束后再计算，不影响首字节延迟
+            total_tokens = count_tokens(prompt) + count_tokens(''.join(sent))
+            logging_service.log_info(
+                f"[REQUEST_END_STREAM] id={request_id} t={elapsed:.3f}s "
+                f"tokens={total_tokens}"
+            )
+        
+        return EventSourceResponse(event_stream(), headers=_SSE_HEADERS)
+    
     # 执行 Gemini CLI
     try:
         raw_output = await gemini_service.execute(prompt, timeout=60.0)
@@ -105,63 +178,31 @@ async def chat_completions(request: Request):
         raise e
     
     # 清理输出
-    cleaned_output = clean_gemini_output(raw_output)
+    if len(raw_output) > _THREAD_CLEAN_THRESHOLD:
+        cleaned_output = await asyncio.to_thread(clean_gemini_output, raw_output)
+    else:
+        cleaned_output = clean_gemini_output(raw_output)
     if not cleaned_output:
-        cleaned_output = "I apologize, I couldn't generate a response."
+        cleaned_output = EMPTY_RESPONSE_TEXT
     
     # 计算 token 数量
     prompt_tokens = count_tokens(prompt)
     completion_tokens = count_tokens(cleaned_output)
     
-    # 处理流式响应
-    if chat_request.stream:
-        async def event_stream():
-            """生成流式响应事件"""
-            chunk_size = 64
-            idx = 0
-            
-            # 分块发送内容
-            while idx < len(cleaned_output):
-                part = cleaned_output[idx:idx + chunk_size]
-                idx += chunk_size
-                
-                chunk = build_chat_completion_chunk(
-                    content=part,
-                    request_id=request_id,
-                    model=chat_request.model,
-                    finish_reason=None
-                )
-                
-                yield f"data: {json.dumps(chunk.dict(), ensure_ascii=False)}\n\n"
-                await asyncio.sleep(0)
-            
-            # 发送完成事件
-            yield "data: [DONE]\n\n"
-        
-        elapsed = time.time() - start_time
-        logging_service.log_info(
-            f"[REQUEST_END_STREAM] id={request_id} t={elapsed:.3f}s "
-            f"tokens={prompt_tokens + completion_tokens}"
-        )
-        
-        return StreamingResponse(
-            event_stream(), 
-            media_type='text/event-stream'
-        )
-    
     # 处理非流式响应
     response = build_chat_completion_response(
         content=cleaned_output,
         model=chat_request.model,
         request_id=request_id,
         prompt_tokens=prompt_tokens,
-        completion_tokens=completion_tokens
+        completion_tokens=completion_tokens,
+        created=int(start_time)
     )
     
     elapsed = time.time() - start_time
     logging_service.log_info(
         f"[REQUEST_END] id={request_id} t={elapsed:.3f}s "
-        f"tokens={response.usage.total_tokens}"
+        f"tokens={response['usage']['total_tokens']}"
     )
     
-    return response
\ No newline at end of file
+    return OrjsonResponse(response)
\ No newline at end of file
@@ -5,7 +5,7 @@
 """
 
 import time
-from fastapi import APIRouter
+from fastapi import APIRouter, Response
 
 from ..models import HealthResponse
 
@@ -19,9 +19,12 @@ async def health():
     健康检查端点
     
     Returns:
-        HealthResponse: 健康状态响应
+        Response: 健康状态响应，由 Pydantic 直接序列化为 JSON
     """
-    return HealthResponse(
-        status="ok",
-        ts=int(time.time())
+    return Response(
+        content=HealthResponse(
+            status="ok",
+            ts=int(time.time())
+        ).model_dump_json(),
+        media_type="application/json"
     )
\ No newline at end of file
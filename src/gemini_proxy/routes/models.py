@@ -4,13 +4,19 @@
 提供模型列表查询端点，返回支持的模型信息。
 """
 
-from fastapi import APIRouter
+from fastapi import APIRouter, Response
 
 from ..models import ModelListResponse, SUPPORTED_MODELS
 
 
 router = APIRouter()
 
+# 模型列表在进程生命周期内不变，导入时序列化一次
+_MODEL_LIST_BODY = ModelListResponse(
+    object="list",
+    data=SUPPORTED_MODELS
+).model_dump_json().encode('utf-8')
+
 
 @router.get('/v1/models', response_model=ModelListResponse)
 @router.get('/models', response_model=ModelListResponse)
@@ -23,9 +29,9 @@ async def list_models():
     - /models (简化格式)
     
     Returns:
-        ModelListResponse: 模型列表响应
+        Response: 预先序列化的模型列表响应
     """
-    return ModelListResponse(
-        object="list",
-        data=SUPPORTED_MODELS
+    return Response(
+        content=_MODEL_LIST_BODY,
+        media_type="application/json"
     )
\ No newline at end of file
@@ -8,27 +8,185 @@ import asyncio
 import os
 import shlex
 import logging
-from typing import List, Optional
+from typing import AsyncIterator, List, Optional, Tuple
+
+import orjson
 from fastapi import HTTPException
 
 from ..config import config
+from ..utils.cleaning import clean_gemini_output
+from .worker_pool import GeminiWorkerPool, kill_process, spawn_process
 
 
 logger = logging.getLogger('gemini-proxy')
 
 
+# 流式读取时单行输出的最大长度
+_STREAM_LINE_LIMIT = 1024 * 1024
+
+# 流式读取时单次读取的最大字节数
+_STREAM_READ_SIZE = 65536
+
+# 日志中预启动进程的命令描述
+_POOLED_CMD = '<pooled worker>'
+
+# 记录上次成功的命令变体的文件名，与日志文件放在同一目录，重启后仍然有效
+_STRATEGY_FILE = 'gemini_strategy.json'
+
+# 子进程的标准输入，进程内只打开一次 /dev/null，避免每次启动进程都打开和关闭
+_DEVNULL_FD = os.open(os.devnull, os.O_RDONLY)
+
+# 候选命令变体，支持不同的 Gemini CLI 版本；None 表示提示词所在位置
+STRATEGY_TEMPLATES = [
+    ('--prompt', None, '--approval-mode', 'yolo'),
+    ('-p', None, '--approval-mode', 'yolo'),
+    (None, '--approval-mode', 'yolo'),
+    # 回退使用短参数 -y（批准模式）
+    ('--prompt', None, '-y'),
+    ('-p', None, '-y'),
+    (None, '-y'),
+]
+
+
 class GeminiService:
     """Gemini CLI 服务类"""
     
     def __init__(self, gemini_path: Optional[str] = None):
         self.gemini_path = gemini_path or config.gemini_path
         self.timeout = config.gemini_timeout
+        # 上一次成功的命令变体下标，后续请求优先使用
+        self._strategy_path = os.path.join(os.path.dirname(config.log_file), _STRATEGY_FILE)
+        self._working_strategy = self._load_working_strategy()
+        # Gemini CLI 路径是否存在的缓存结果，不存在时每次请求重新检查
+        self._path_ok = os.path.exists(self.gemini_path)
+        # 预启动进程池，GEMINI_POOL_SIZE 为 0 时不启用；参数跟随已知可用的命令变体
+        pool_kwargs = {}
+        if self._working_strategy is not None:
+            pool_kwargs['args'] = self._stdin_args(self._working_strategy)
+        self.pool = GeminiWorkerPool(
+            self.gemini_path,
+            config.gemini_pool_size,
+            limit=_STREAM_LINE_LIMIT,
+            **pool_kwargs
+        )
+    
+    async def start(self) -> None:
+        """启动预启动进程池"""
+        await self.pool.start()
+    
+    async def stop(self) -> None:
+        """关闭预启动进程池"""
+        await self.pool.close()
+    
+    def _build_command(self, strategy: int, prompt: str) -> List[str]:
+        """
+        根据命令变体模板构建命令
+        
+        Args:
+            strategy: 命令变体下标
+            prompt: 提示词
+        
+        Returns:
+            List[str]: 命令参数列表
+        """
+        return [self.gemini_path] + [
+            prompt if arg is None else arg
+            for arg in STRATEGY_TEMPLATES[strategy]
+        ]
+    
+    def _load_working_strategy(self) -> Optional[int]:
+        """
+        读取上次运行时记录的成功命令变体
+        
+        Returns:
+            Optional[int]: 命令变体下标，没有记录或记录不适用于当前 CLI 路径时返回None
+        """
+        try:
+            with open(self._strategy_path, 'rb') as f:
+                data = orjson.loads(f.read())
+        except (OSError, orjson.JSONDecodeError):
+            return None
+        
+        if not isinstance(data, dict) or data.get('gemini_path') != self.gemini_path:
+            return None
+        strategy = data.get('strategy')
+        if isinstance(strategy, int) and 0 <= strategy < len(STRATEGY_TEMPLATES):
+            return strategy
+        return None
+    
+    def _set_working_strategy(self, strategy: Optional[int]) -> None:
+        """
+        更新成功的命令变体，变化时写入文件供重启后使用
+        
+        Args:
+            strategy: 命令变体下标，None 表示清除记录
+        """
+        if strategy == self._working_strategy:
+            return
+        self._working_strategy = strategy
+        if strategy is not None:
+            self.pool.set_args(self._stdin_args(strategy))
+        try:
+            with open(self._strategy_path, 'wb') as f:
+                f.write(orjson.dumps({'gemini_path': self.gemini_path, 'strategy': strategy}))
+        except OSError as e:
+            logger.warning(f"Failed to save Gemini strategy: {str(e)}")
+    
+    @staticmethod
+    def _stdin_args(strategy: int) -> Tuple[str, ...]:
+        """
+        获取命令变体中提示词之后的参数，用于从标准输入读取提示词的预启动进程
+        
+        提示词之前只有提示词选项（如 --prompt），从标准输入读取时不需要。
+        
+        Args:
+            strategy: 命令变体下标
+        
+        Returns:
+            Tuple[str, ...]: 命令参数
+        """
+        template = STRATEGY_TEMPLATES[strategy]
+        return template[template.index(None) + 1:]
+    
+    def _strategy_order(self) -> List[int]:
+        """
+        获取命令变体的尝试顺序，上次成功的变体排在最前
+        
+        Returns:
+            List[int]: 命令变体下标列表
+        """
+        order = list(range(len(STRATEGY_TEMPLATES)))
+        preferred = self._working_strategy
+        if preferred is not None:
+            order.remove(preferred)
+            order.insert(0, preferred)
+        return order
+    
+    def _check_gemini_path(self) -> None:
+        """
+        验证 Gemini CLI 路径是否存在
+        
+        路径存在的结果会被缓存，之后的请求不再访问文件系统；
+        启动进程时发现文件已不存在会清除缓存。
+        
+        Raises:
+            HTTPException: 当路径不存在时抛出
+        """
+        if self._path_ok:
+            return
+        self._path_ok = os.path.exists(self.gemini_path)
+        if not self._path_ok:
+            logger.error(f"Gemini CLI not found at {self.gemini_path}")
+            raise HTTPException(
+                status_code=500, 
+                detail=f"Gemini CLI not found at {self.gemini_path}"
+            )
     
     async def execute(
         self, 
         prompt: str, 
         timeout: Optional[float] = None
-    ) -> str:
+    ) -> bytes:
         """
         执行 Gemini CLI 命令
         
@@ -37,7 +195,7 @@ class GeminiService:
             timeout: 超时时间，如果为None则使用配置中的超时时间
         
         Returns:
-            str: Gemini CLI 的输出
+            bytes: Gemini CLI 的原始输出（未解码）
         
         Raises:
             HTTPException: 当执行失败时抛出
@@ -46,26 +204,28 @@ class GeminiService:
             timeout = self.timeout
         
         # 验证 Gemini CLI 路径
-        if not os.path.exists(self.gemini_path):
-            logger.error(f"Gemini CLI not found at {self.gemini_path}")
-            raise HTTPException(
-                status_code=500, 
-                detail=f"Gemini CLI not found at {self.gemini_path}"
-            )
-        
-        # 候选命令变体，支持不同的 Gemini CLI 版本
-        strategies = [
-            [self.gemini_path, '--prompt', prompt, '--approval-mode', 'yolo'],
-            [self.gemini_path, '-p', prompt, '--approval-mode', 'yolo'],
-            [self.gemini_path, prompt, '--approval-mode', 'yolo'],
-            # 回退使用短参数 -y（批准模式）
-            [self.gemini_path, '--prompt', prompt, '-y'],
-            [self.gemini_path, '-p', prompt, '-y'],
-            [self.gemini_path, prompt, '-y'],
-        ]
+        self._check_gemini_path()
         
         errors = []
-        for cmd in strategies:
+        
+        # 优先使用预启动进程
+        proc = await self.pool.acquire(prompt, timeout)
+        if proc is not None:
+            try:
+                result = await self._collect_output(proc, _POOLED_CMD, timeout)
+            except asyncio.TimeoutError:
+                # 超时只说明提示词处理较慢，不计入进程池的失败次数
+                errors.append(f"timeout for cmd: {_POOLED_CMD}")
+            else:
+                self.pool.record_result(result is not None)
+                if result is not None:
+                    logger.info(f"Gemini succeeded for cmd: {_POOLED_CMD} (len_out={len(result)})")
+                    return result
+                errors.append(f"rc=non-zero cmd={_POOLED_CMD}")
+        
+        # 优先尝试上次成功的命令变体，失败后再依次探测其余变体
+        for strategy in self._strategy_order():
+            cmd = self._build_command(strategy, prompt)
             safe_cmd = ' '.join(shlex.quote(str(c)) for c in cmd)
             logger.info(f"Trying Gemini CLI command: {safe_cmd}")
             
@@ -73,9 +233,12 @@ class GeminiService:
                 result = await self._run_command(cmd, timeout)
                 if result is not None:
                     logger.info(f"Gemini succeeded for cmd: {safe_cmd} (len_out={len(result)})")
+                    self._set_working_strategy(strategy)
                     return result
                 else:
                     errors.append(f"rc=non-zero cmd={safe_cmd}")
+                    if strategy == self._working_strategy:
+                        self._set_working_strategy(None)
                     
             except asyncio.TimeoutError:
                 logger.warning(f"Gemini attempt timed out for cmd: {safe_cmd}")
@@ -95,11 +258,154 @@ class GeminiService:
             detail=f"Gemini CLI failed (tried multiple argument styles): {combined_errors}"
         )
     
+    async def execute_stream(
+        self, 
+        prompt: str, 
+        timeout: Optional[float] = None
+    ) -> AsyncIterator[str]:
+        """
+        执行 Gemini CLI 命令并按读取批次产出清理后的标准输出
+        
+        每次读取中到达的全部完整行合并为一个文本块，清理后为空的块不会产出。
+        
+        某个命令变体在产出任何非空文本块前失败时（如只输出了 CLI 横幅就以非零码退出），
+        继续尝试下一个变体；一旦产出了非空文本块，就不再切换变体。
+        
+        Args:
+            prompt: 提示词
+            timeout: 单个命令变体的超时时间，如果为None则使用配置中的超时时间
+        
+        Yields:
+            str: 由完整输出行清理得到的非空文本块
+        
+        Raises:
+            HTTPException: 当所有命令变体都在产出输出前失败时抛出
+        """
+        if timeout is None:
+            timeout = self.timeout
+        
+        self._check_gemini_path()
+        
+        errors = []
+        
+        # 优先使用预启动进程（记为 None），然后依次尝试命令变体
+        pooled = await self.pool.acquire(prompt, timeout)
+        attempts: List[Optional[int]] = [None] if pooled is not None else []
+        attempts += self._strategy_order()
+        
+        for strategy in attempts:
+            if strategy is None:
+                proc = pooled
+                safe_cmd = _POOLED_CMD
+            else:
+                cmd = self._build_command(strategy, prompt)
+                safe_cmd = ' '.join(shlex.quote(str(c)) for c in cmd)
+                logger.info(f"Trying Gemini CLI command (stream): {safe_cmd}")
+                
+                try:
+                    proc = await self._spawn(cmd)
+                except Exception as e:
+                    logger.exception(f"Error running gemini cmd: {safe_cmd}")
+                    errors.append(f"exception for cmd={safe_cmd}: {str(e)}")
+                    continue
+            
+            # 并发读取 stderr，避免管道写满阻塞子进程
+            stderr_task = asyncio.ensure_future(proc.stderr.read())
+            loop = asyncio.get_running_loop()
+            deadline = loop.time() + timeout
+            produced = False
+            timed_out = False
+            pending = bytearray()
+            try:
+                while True:
+                    data = await asyncio.wait_for(
+                        proc.stdout.read(_STREAM_READ_SIZE), 
+                        timeout=max(0.0, deadline - loop.time())
+                    )
+                    if not data:
+                        break
+                    pending += data
+                    # 只产出完整的行，不完整的行留到下一次读取
+                    end = pending.rfind(b'\n') + 1
+                    if not end:
+                        if len(pending) < _STREAM_LINE_LIMIT:
+                            continue
+                        end = len(pending)
+                    block = clean_gemini_output(bytes(pending[:end]))
+                    del pending[:end]
+                    if block:
+                        produced = True
+                        yield block
+                block = clean_gemini_output(bytes(pending))
+                if block:
+                    produced = True
+                    yield block
+                await asyncio.wait_for(
+                    proc.wait(), 
+                    timeout=max(0.0, deadline - loop.time())
+                )
+            except asyncio.TimeoutError:
+                timed_out = True
+            finally:
+                if proc.returncode is None:
+                    await kill_process(proc)
+                stderr_text = (await stderr_task).decode(errors='ignore')
+            
+            if timed_out:
+                logger.warning(f"Gemini attempt timed out for cmd: {safe_cmd}")
+                errors.append(f"timeout for cmd: {safe_cmd}")
+            elif proc.returncode == 0:
+                logger.info(f"Gemini stream finished for cmd: {safe_cmd}")
+                if strategy is None:
+                    self.pool.record_result(True)
+                else:
+                    self._set_working_strategy(strategy)
+                return
+            else:
+                logger.warning(
+                    f"Gemini returned code {proc.returncode} for cmd: {safe_cmd} "
+                    f"stderr={stderr_text[:400]}"
+                )
+                errors.append(f"rc=non-zero cmd={safe_cmd}")
+                if strategy is None:
+                    self.pool.record_result(False)
+                elif strategy == self._working_strategy:
+                    self._set_working_strategy(None)
+            
+            # 已经向调用方产出非空输出时无法再切换命令变体
+            if produced:
+                return
+        
+        # 所有策略都失败
+        combined_errors = '\n'.join(errors)[:2000]
+        logger.error(f"All Gemini strategies failed: {combined_errors}")
+        raise HTTPException(
+            status_code=500, 
+            detail=f"Gemini CLI failed (tried multiple argument styles): {combined_errors}"
+        )
+    
+    async def _spawn(self, cmd: List[str]) -> asyncio.subprocess.Process:
+        """
+        以新会话启动命令，便于超时后终止整个进程组
+        
+        Args:
+            cmd: 命令参数列表
+        
+        Returns:
+            Process: 子进程
+        """
+        try:
+            return await spawn_process(cmd, _DEVNULL_FD, _STREAM_LINE_LIMIT)
+        except FileNotFoundError:
+            # CLI 已被移除，下一次请求重新检查路径
+            self._path_ok = False
+            raise
+    
     async def _run_command(
         self, 
         cmd: List[str], 
         timeout: float
-    ) -> Optional[str]:
+    ) -> Optional[bytes]:
         """
         运行单个命令
         
@@ -108,40 +414,66 @@ class GeminiService:
             timeout: 超时时间
         
         Returns:
-            Optional[str]: 命令输出，如果失败返回None
+            Optional[bytes]: 命令输出，如果失败返回None
+        
+        Raises:
+            asyncio.TimeoutError: 命令超时（进程已被终止）
+        """
+        try:
+            proc = await self._spawn(cmd)
+        except Exception as e:
+            logger.exception(f"Exception running command: {' '.join(cmd)}")
+            return None
+        
+        return await self._collect_output(proc, ' '.join(cmd), timeout)
+    
+    async def _collect_output(
+        self, 
+        proc: asyncio.subprocess.Process, 
+        cmd_text: str, 
+        timeout: float
+    ) -> Optional[bytes]:
+        """
+        等待子进程结束并收集输出
+        
+        Args:
+            proc: 子进程
+            cmd_text: 用于日志的命令描述
+            timeout: 超时时间
+        
+        Returns:
+            Optional[bytes]: 命令输出，如果失败返回None
+        
+        Raises:
+            asyncio.TimeoutError: 命令超时（进程已被终止）
         """
         try:
-            proc = await asyncio.create_subprocess_exec(
-                *cmd,
-                stdin=asyncio.subprocess.DEVNULL,
-                stdout=asyncio.subprocess.PIPE,
-                stderr=asyncio.subprocess.PIPE,
-            )
-            
             try:
                 stdout, stderr = await asyncio.wait_for(
                     proc.communicate(), 
                     timeout=timeout
                 )
             except asyncio.TimeoutError:
-                logger.warning(f"Command timed out: {' '.join(cmd)}")
-                proc.kill()
-                return None
-            
-            stdout_text = stdout.decode(errors='ignore')
-            stderr_text = stderr.decode(errors='ignore')
+                logger.warning(f"Command timed out: {cmd_text}")
+                # 等待进程退出，避免残留僵尸进程
+                await kill_process(proc)
+                raise
             
+            # 输出保持为字节，清理后再统一解码
             if proc.returncode == 0:
-                return stdout_text
+                return stdout
             else:
+                stderr_text = stderr.decode(errors='ignore')
                 logger.warning(
-                    f"Gemini returned code {proc.returncode} for cmd: {' '.join(cmd)} "
+                    f"Gemini returned code {proc.returncode} for cmd: {cmd_text} "
                     f"stderr={stderr_text[:400]}"
                 )
                 return None
                 
+        except asyncio.TimeoutError:
+            raise
         except Exception as e:
-            logger.exception(f"Exception running command: {' '.join(cmd)}")
+            logger.exception(f"Exception running command: {cmd_text}")
             return None
     
     def validate_gemini_path(self) -> bool:
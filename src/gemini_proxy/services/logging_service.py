@@ -4,15 +4,73 @@
 负责请求/响应日志记录、日志轮转管理和结构化日志输出。
 """
 
+import asyncio
+import atexit
+import hashlib
 import logging
+import os
+import queue
 import time
-import uuid
-import json
-from logging.handlers import RotatingFileHandler
+from logging.handlers import QueueHandler, QueueListener, RotatingFileHandler
 from typing import Dict, Any, Optional
+
+import orjson
 from fastapi import Request, Response
 
 from ..config import config
+from ..utils.response_utils import new_request_id
+
+
+# 后台写入时单次批量写入的最大日志条数
+_LOG_BATCH_SIZE = 256
+
+# 日志中请求/响应体保留的最大字符数
+_LOG_BODY_PREVIEW_CHARS = 2000
+
+# 超过该字节数的请求/响应体只记录大小
+_LOG_BODY_MAX_BYTES = 65536
+
+# 只有 DEBUG 级别才在日志中记录请求体内容，其余级别只记录长度和摘要
+_LOG_REQUEST_CONTENT = config.log_level == 'DEBUG'
+
+
+def _preview_body(data: bytes) -> str:
+    """
+    生成用于日志的请求/响应体预览，只解码需要保留的部分
+    
+    Args:
+        data: 原始请求/响应体
+    
+    Returns:
+        str: 截断后的内容，过大时只包含字节数
+    """
+    if not data:
+        return ''
+    if len(data) > _LOG_BODY_MAX_BYTES:
+        return f"<{len(data)} bytes truncated>"
+    # UTF-8 单个字符最多 4 字节
+    preview = data[:_LOG_BODY_PREVIEW_CHARS * 4].decode(errors='ignore')
+    return preview[:_LOG_BODY_PREVIEW_CHARS]
+
+
+def _describe_request_body(data: bytes) -> str:
+    """
+    生成用于日志的请求体描述
+    
+    非 DEBUG 级别不解码请求体，只记录长度和 SHA-1 摘要前缀，
+    既避免在请求路径上解码大段提示词，也不把提示词内容写入日志。
+    
+    Args:
+        data: 原始请求体
+    
+    Returns:
+        str: 请求体描述
+    """
+    if _LOG_REQUEST_CONTENT:
+        return _preview_body(data)
+    if not data:
+        return ''
+    return f"<{len(data)} bytes sha1={hashlib.sha1(data).hexdigest()[:16]}>"
 
 
 class LoggingService:
@@ -22,7 +80,16 @@ class LoggingService:
         self.log_path = config.log_file
         self.max_log_size = config.max_log_size
         self.backup_count = config.log_backup_count
+        self.queue_size = config.log_queue_size
+        self._queue: Optional[asyncio.Queue] = None
+        self._writer_task: Optional[asyncio.Task] = None
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._log_fd: Optional[int] = None
+        self._log_ino: Optional[int] = None
+        self._listener: Optional[QueueListener] = None
         self._setup_logging()
+        atexit.register(self._close_log_fd)
+        atexit.register(self._stop_listener)
     
     def _setup_logging(self) -> None:
         """设置日志配置"""
@@ -38,8 +105,13 @@ class LoggingService:
             format='%(asctime)s %(levelname)s %(message)s'
         )
         
-        # 为代理服务添加文件处理器
+        # 为代理服务添加文件处理器；同一日志文件只添加一次，
+        # 重复创建服务实例（如测试或重新加载）时不会重复写入每条日志
         logger = logging.getLogger('gemini-proxy')
+        log_path = os.path.abspath(self.log_path)
+        if any(getattr(h, 'log_path', None) == log_path for h in logger.handlers):
+            return
+        
         file_handler = RotatingFileHandler(
             self.log_path,
             maxBytes=self.max_log_size,
@@ -49,7 +121,139 @@ class LoggingService:
         file_handler.setLevel(logging.INFO)
         file_formatter = logging.Formatter('%(asctime)s %(levelname)s %(message)s')
         file_handler.setFormatter(file_formatter)
-        logger.addHandler(file_handler)
+        
+        # 文件写入和轮转在独立线程中完成，记录日志时只需放入队列
+        log_queue = queue.SimpleQueue()
+        queue_handler = QueueHandler(log_queue)
+        queue_handler.log_path = log_path
+        logger.addHandler(queue_handler)
+        self._listener = QueueListener(
+            log_queue, file_handler, respect_handler_level=True
+        )
+        self._listener.start()
+    
+    def _stop_listener(self) -> None:
+        """停止文件日志线程，退出前写完队列中剩余的日志"""
+        if self._listener is not None:
+            self._listener.stop()
+            self._listener = None
+    
+    async def start(self) -> None:
+        """启动后台日志写入任务"""
+        self._ensure_writer()
+    
+    async def stop(self) -> None:
+        """等待队列中的日志全部落盘后停止后台写入任务"""
+        if self._queue is None or self._loop is not asyncio.get_running_loop():
+            return
+        await self._queue.join()
+        if self._writer_task is not None:
+            self._writer_task.cancel()
+            try:
+                await self._writer_task
+            except asyncio.CancelledError:
+                pass
+        self._writer_task = None
+    
+    def _ensure_writer(self) -> asyncio.Queue:
+        """
+        确保当前事件循环中存在日志队列和后台写入任务
+        
+        队列和任务都绑定到创建它们的事件循环，循环变化时（如测试中）重新创建。
+        
+        Returns:
+            asyncio.Queue: 日志行队列
+        """
+        loop = asyncio.get_running_loop()
+        if self._queue is None or self._loop is not loop:
+            self._queue = asyncio.Queue(maxsize=self.queue_size)
+            self._loop = loop
+            self._writer_task = None
+        if self._writer_task is None or self._writer_task.done():
+            self._writer_task = loop.create_task(self._write_loop(self._queue))
+        return self._queue
+    
+    def _enqueue(self, log_entry: Dict[str, Any]) -> None:
+        """
+        将日志条目放入写入队列，不在请求路径上执行磁盘 I/O
+        
+        Args:
+            log_entry: 日志条目
+        """
+        line = orjson.dumps(log_entry) + b'\n'
+        try:
+            self._ensure_writer().put_nowait(line)
+        except asyncio.QueueFull:
+            logging.getLogger('gemini-proxy').warning(
+                "Log queue full, dropping log entry"
+            )
+    
+    async def _write_loop(self, queue: asyncio.Queue) -> None:
+        """
+        后台写入循环：批量取出日志行，在线程池中一次性写入文件
+        
+        Args:
+            queue: 日志行队列
+        """
+        loop = asyncio.get_running_loop()
+        while True:
+            batch = [await queue.get()]
+            while len(batch) < _LOG_BATCH_SIZE and not queue.empty():
+                batch.append(queue.get_nowait())
+            try:
+                await loop.run_in_executor(None, self._append_lines, b''.join(batch))
+            except Exception as e:
+                logging.error(f"Failed to write log entries: {str(e)}")
+            finally:
+                for _ in batch:
+                    queue.task_done()
+    
+    def _append_lines(self, data: bytes) -> None:
+        """
+        将日志数据追加写入文件（在线程池中执行）
+        
+        文件描述符以 O_APPEND 打开并保持打开，多个进程同时追加也不会互相覆盖。
+        
+        Args:
+            data: 已编码的日志行
+        """
+        fd = self._get_log_fd()
+        view = memoryview(data)
+        while view:
+            view = view[os.write(fd, view):]
+    
+    def _get_log_fd(self) -> int:
+        """
+        获取日志文件描述符，日志文件被轮转或删除后重新打开
+        
+        Returns:
+            int: 日志文件描述符
+        """
+        if self._log_fd is not None:
+            try:
+                if os.stat(self.log_path).st_ino == self._log_ino:
+                    return self._log_fd
+            except FileNotFoundError:
+                pass
+            self._close_log_fd()
+        
+        self._log_fd = os.open(
+            self.log_path, 
+            os.O_WRONLY | os.O_APPEND | os.O_CREAT, 
+            0o644
+        )
+        self._log_ino = os.fstat(self._log_fd).st_ino
+        return self._log_fd
+    
+    def _close_log_fd(self) -> None:
+        """关闭日志文件描述符"""
+        if self._log_fd is not None:
+            try:
+                os.close(self._log_fd)
+            except OSError:
+                pass
+            self._log_fd = None
+            self._log_ino = None
     
     async def log_request_response(
         self,
@@ -71,18 +275,17 @@ class LoggingService:
         """
         log_entry = {
             'ts': int(time.time()),
-            'id': uuid.uuid4().hex,
+            'id': getattr(request.state, 'request_id', None) or new_request_id(),
             'method': request.method,
             'path': str(request.url.path),
-            'request': request_body,
+            'request': request_body[:_LOG_BODY_PREVIEW_CHARS],
             'status': getattr(response, 'status_code', None),
-            'response': response_body[:2000],  # 限制响应体长度
+            'response': response_body[:_LOG_BODY_PREVIEW_CHARS],  # 限制响应体长度
             'duration': duration,
         }
         
         try:
-            with open(self.log_path, 'a', encoding='utf-8') as f:
-                f.write(json.dumps(log_entry, ensure_ascii=False) + '\n')
+            self._enqueue(log_entry)
         except Exception as e:
             logging.error(f"Failed to write log entry: {str(e)}")
     
@@ -104,18 +307,17 @@ class LoggingService:
         """
         log_entry = {
             'ts': int(time.time()),
-            'id': uuid.uuid4().hex,
+            'id': getattr(request.state, 'request_id', None) or new_request_id(),
             'method': request.method,
             'path': str(request.url.path),
-            'request': request_body,
+            'request': request_body[:_LOG_BODY_PREVIEW_CHARS],
             'status': 500,
             'response': str(error),
             'duration': duration,
         }
         
         try:
-            with open(self.log_path, 'a', encoding='utf-8') as f:
-                f.write(json.dumps(log_entry, ensure_ascii=False) + '\n')
+            self._enqueue(log_entry)
         except Exception as e:
             logging.error(f"Failed to write error log entry: {str(e)}")
     
@@ -192,13 +394,19 @@ async def log_requests_middleware(request: Request, call_next):
     Returns:
         Response: 响应对象
     """
-    request_id = uuid.uuid4().hex
+    request.state.request_id = new_request_id()
     start_time = time.time()
     
     try:
         # 读取请求体
         body_bytes = await request.body()
-        request_body = body_bytes.decode(errors='ignore') if body_bytes else ''
+        request_body = _describe_request_body(body_bytes)
+        # 解析一次 JSON 请求体并缓存，路由中直接复用
+        if body_bytes and request.headers.get('content-type', '').startswith('application/json'):
+            try:
+                request.state.parsed_body = orjson.loads(body_bytes)
+            except orjson.JSONDecodeError:
+                pass
     except Exception:
         request_body = ''
     
@@ -210,7 +418,7 @@ async def log_requests_middleware(request: Request, call_next):
         response_body = ''
         try:
             if hasattr(response, 'body') and response.body is not None:
-                response_body = response.body.decode(errors='ignore') if isinstance(response.body, (bytes, bytearray)) else str(response.body)
+                response_body = _preview_body(response.body) if isinstance(response.body, (bytes, bytearray)) else str(response.body)[:_LOG_BODY_PREVIEW_CHARS]
         except Exception:
             response_body = ''
         
@@ -0,0 +1,253 @@
+"""
+Gemini 预启动进程池模块
+
+预先启动若干 Gemini CLI 进程，让它们完成初始化后阻塞等待标准输入中的提示词。
+请求到来时直接写入提示词，省去进程创建和 CLI 启动的开销；每个进程被取走后
+立即在后台补充一个新进程。
+"""
+
+import asyncio
+import logging
+import os
+import signal
+from typing import Optional, Sequence, Set
+
+
+logger = logging.getLogger('gemini-proxy')
+
+
+# 连续失败达到该次数后认为 CLI 不支持从标准输入读取提示词，停用进程池
+_MAX_CONSECUTIVE_FAILURES = 3
+
+
+async def spawn_process(
+    args: Sequence[str],
+    stdin: int,
+    limit: int
+) -> asyncio.subprocess.Process:
+    """
+    以新会话启动子进程，标准输出和标准错误均为管道
+    
+    这里不传 preexec_fn 和 user/group 等参数，CPython 在 Linux 上因此可以用
+    vfork+exec 启动子进程，开销不随父进程内存增大；新会话（setsid）不影响这一点。
+    
+    Args:
+        args: 命令参数列表
+        stdin: 标准输入（文件描述符或 asyncio.subprocess.PIPE）
+        limit: 输出流缓冲区上限
+    
+    Returns:
+        Process: 子进程
+    """
+    return await asyncio.create_subprocess_exec(
+        *args,
+        stdin=stdin,
+        stdout=asyncio.subprocess.PIPE,
+        stderr=asyncio.subprocess.PIPE,
+        limit=limit,
+        start_new_session=True,
+    )
+
+
+async def kill_process(proc: asyncio.subprocess.Process) -> None:
+    """
+    终止子进程及其派生的进程并等待退出
+    
+    子进程以新会话启动，整个进程组一起终止，避免孙进程继续持有输出管道。
+    已被回收的进程只等待退出：其进程号可能已被复用，不能再发送信号。
+    
+    Args:
+        proc: 子进程
+    """
+    if proc.returncode is not None:
+        await proc.wait()
+        return
+    try:
+        if hasattr(os, 'killpg'):
+            os.killpg(proc.pid, signal.SIGKILL)
+        else:
+            proc.kill()
+    except ProcessLookupError:
+        pass
+    await proc.wait()
+
+
+class GeminiWorkerPool:
+    """Gemini CLI 预启动进程池"""
+    
+    def __init__(
+        self,
+        gemini_path: str,
+        size: int,
+        args: Sequence[str] = ('--approval-mode', 'yolo'),
+        limit: int = 2 ** 16
+    ):
+        self.gemini_path = gemini_path
+        self.size = size
+        self.args = list(args)
+        self.limit = limit
+        self.enabled = size > 0
+        self._idle: Optional[asyncio.Queue] = None
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._spawning: Set[asyncio.Task] = set()
+        self._failures = 0
+    
+    async def start(self) -> None:
+        """预启动进程"""
+        self._ensure_started()
+    
+    async def close(self) -> None:
+        """停止补充进程并终止所有空闲进程"""
+        if self._idle is None or self._loop is not asyncio.get_running_loop():
+            return
+        for task in list(self._spawning):
+            task.cancel()
+        while not self._idle.empty():
+            await kill_process(self._idle.get_nowait())
+        self._idle = None
+    
+    def _ensure_started(self) -> Optional[asyncio.Queue]:
+        """
+        确保当前事件循环中存在空闲进程队列
+        
+        子进程绑定到创建它们的事件循环，循环变化时（如测试中）重新启动。
+        
+        Returns:
+            Optional[asyncio.Queue]: 空闲进程队列，进程池停用时返回None
+        """
+        if not self.enabled:
+            return None
+        loop = asyncio.get_running_loop()
+        if self._idle is None or self._loop is not loop:
+            self._idle = asyncio.Queue()
+            self._loop = loop
+            for _ in range(self.size):
+                self._schedule_spawn()
+        return self._idle
+    
+    def _schedule_spawn(self) -> None:
+        """在后台启动一个新进程"""
+        if not self.enabled:
+            return
+        task = self._loop.create_task(self._spawn(self._idle))
+        self._spawning.add(task)
+        task.add_done_callback(self._spawning.discard)
+    
+    async def _spawn(self, queue: asyncio.Queue) -> None:
+        """
+        启动一个等待提示词的 Gemini CLI 进程并放入空闲队列
+        
+        Args:
+            queue: 空闲进程队列
+        """
+        try:
+            proc = await spawn_process(
+                [self.gemini_path, *self.args],
+                asyncio.subprocess.PIPE,
+                self.limit
+            )
+        except Exception:
+            logger.exception(f"Failed to spawn pooled Gemini worker: {self.gemini_path}")
+            self.record_result(False)
+            return
+        # 启动期间进程池已停用或已重建
+        if not self.enabled or queue is not self._idle:
+            await kill_process(proc)
+            return
+        queue.put_nowait(proc)
+    
+    async def acquire(
+        self, 
+        prompt: str, 
+        timeout: float
+    ) -> Optional[asyncio.subprocess.Process]:
+        """
+        取出一个空闲进程并写入提示词
+        
+        写入提示词有超时限制：不读取标准输入的 CLI 在提示词超过管道缓冲区时会使写入一直阻塞。
+        
+        Args:
+            prompt: 提示词
+            timeout: 写入提示词的超时时间
+        
+        Returns:
+            Optional[Process]: 已写入提示词并关闭标准输入的进程，没有可用进程时返回None
+        """
+        queue = self._ensure_started()
+        while queue is not None and not queue.empty():
+            proc = queue.get_nowait()
+            self._schedule_spawn()
+            
+            # 空闲期间退出说明 CLI 没有等待标准输入
+            if proc.returncode is not None:
+                await kill_process(proc)
+                self.record_result(False)
+                continue
+            
+            try:
+                await asyncio.wait_for(
+                    self._write_prompt(proc, prompt.encode('utf-8')), 
+                    timeout=timeout
+                )
+            except (BrokenPipeError, ConnectionResetError):
+                await kill_process(proc)
+                self.record_result(False)
+                continue
+            except asyncio.TimeoutError:
+                # 进程没有读取标准输入，其余空闲进程同样不会读取，直接放弃使用进程池
+                logger.warning("Timed out writing prompt to pooled Gemini worker")
+                await kill_process(proc)
+                self.record_result(False)
+                return None
+            return proc
+        return None
+    
+    @staticmethod
+    async def _write_prompt(proc: asyncio.subprocess.Process, data: bytes) -> None:
+        """
+        写入提示词并关闭标准输入
+        
+        Args:
+            proc: 子进程
+            data: 已编码的提示词
+        """
+        proc.stdin.write(data)
+        await proc.stdin.drain()
+        proc.stdin.close()
+    
+    def set_args(self, args: Sequence[str]) -> None:
+        """
+        更换启动参数，以旧参数启动的空闲进程全部替换
+        
+        参数变化后重新启用因连续失败而停用的进程池。
+        
+        Args:
+            args: 新的命令参数（不含 CLI 路径）
+        """
+        args = list(args)
+        if args == self.args:
+            return
+        self.args = args
+        self._failures = 0
+        self.enabled = self.size > 0
+        if self._idle is not None and self._loop is not None and self._loop.is_running():
+            self._loop.create_task(self.close())
+    
+    def record_result(self, success: bool) -> None:
+        """
+        记录进程池进程的执行结果，连续失败过多时停用进程池
+        
+        Args:
+            success: 是否执行成功
+        """
+        if success:
+            self._failures = 0
+            return
+        self._failures += 1
+        if self.enabled and self._failures >= _MAX_CONSECUTIVE_FAILURES:
+            logger.warning(
+                "Gemini CLI does not accept prompts on stdin, disabling worker pool"
+            )
+            self.enabled = False
+            if self._loop is not None and self._loop.is_running():
+                self._loop.create_task(self.close())
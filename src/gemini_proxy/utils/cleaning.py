@@ -4,13 +4,69 @@
 提供 Gemini CLI 输出清理功能。
 """
 
+import re
 
-def clean_gemini_output(output: str) -> str:
+
+# 装饰字符，仅由这些字符组成的行会被跳过
+_DECORATION_CHARS = b"-_=*~ "
+
+# 框线字符，包含这些字符的行会被跳过；按 UTF-8 编码匹配，输出无需先解码
+_BOX_CHARS = '█░╭╮╯╰│─┌┐└┘'
+_BOX_CHARS_RE = re.compile(b'|'.join(re.escape(c.encode('utf-8')) for c in _BOX_CHARS))
+
+# 超过该字节数的输出逐行写入缓冲区，不保留清理后行的中间列表
+_LARGE_OUTPUT_BYTES = 262144
+
+# bytes.strip/splitlines 只识别 ASCII 空白和 \n、\r 换行，str 版本还会处理以下空白和换行符；
+# 输出中出现这些字符（如中文输出中的全角空格 U+3000）时解码后按文本清理，结果与 str 版本一致。
+# 单字节字符直接查找；多字节字符按 UTF-8 首字节分组，首字节出现时才用正则确认
+_ASCII_TEXT_ONLY_SPACES = (b'\x0b', b'\x0c', b'\x1c', b'\x1d', b'\x1e', b'\x1f')
+_NON_ASCII_TEXT_ONLY_SPACE_RES = (
+    # U+0085、U+00A0
+    (b'\xc2', re.compile(rb'\xc2[\x85\xa0]')),
+    # U+1680
+    (b'\xe1', re.compile(rb'\xe1\x9a\x80')),
+    # U+2000-U+200A、U+2028、U+2029、U+202F、U+205F
+    (b'\xe2', re.compile(rb'\xe2(?:\x80[\x80-\x8a\xa8\xa9\xaf]|\x81\x9f)')),
+    # U+3000
+    (b'\xe3', re.compile(rb'\xe3\x80\x80')),
+)
+
+# 按文本清理时使用的装饰字符和框线字符
+_DECORATION_TEXT = _DECORATION_CHARS.decode('ascii')
+_BOX_CHARS_TEXT_RE = re.compile('[' + _BOX_CHARS + ']')
+
+
+def _has_text_only_spaces(output: bytes) -> bool:
+    """
+    检查输出中是否包含字节操作无法识别的空白或换行符
+    
+    Args:
+        output: 原始输出（UTF-8 编码）
+    
+    Returns:
+        bool: 是否需要解码后按文本清理
+    """
+    if any(s in output for s in _ASCII_TEXT_ONLY_SPACES):
+        return True
+    # 纯 ASCII 输出不可能包含多字节字符
+    if output.isascii():
+        return False
+    return any(
+        lead in output and pattern.search(output) is not None
+        for lead, pattern in _NON_ASCII_TEXT_ONLY_SPACE_RES
+    )
+
+
+def clean_gemini_output(output: bytes) -> str:
     """
     清理 Gemini CLI 输出的简单启发式方法
     
+    整个清理过程都在字节上进行，只对清理后的结果解码一次；输出中出现
+    字节操作无法识别的空白或换行符时，解码后按文本清理。
+    
     Args:
-        output: 原始 Gemini CLI 输出
+        output: 原始 Gemini CLI 输出（UTF-8 编码）
     
     Returns:
         str: 清理后的输出
@@ -18,17 +74,73 @@ def clean_gemini_output(output: str) -> str:
     if not output:
         return ""
     
-    lines = [ln.strip() for ln in output.splitlines()]
-    lines = [ln for ln in lines if ln]
+    if _has_text_only_spaces(output):
+        return _clean_text(output.decode(errors='ignore'))
+    
+    if len(output) > _LARGE_OUTPUT_BYTES:
+        return _clean_large_output(output)
+    
+    # 去除首尾空白并跳过空行和仅包含装饰字符的行，逐行操作都由 C 实现完成
+    cleaned = [
+        ln for ln in map(bytes.strip, output.splitlines())
+        if ln and (len(ln) <= 3 or ln.lstrip(_DECORATION_CHARS))
+    ]
+    
+    # 只有输出中出现框线字符时才逐行检查
+    if _BOX_CHARS_RE.search(output) is not None:
+        search = _BOX_CHARS_RE.search
+        cleaned = [ln for ln in cleaned if search(ln) is None]
+    
+    return b' '.join(cleaned).decode(errors='ignore').strip()
+
+
+def _clean_large_output(output: bytes) -> str:
+    """
+    清理较大的 Gemini CLI 输出
+    
+    与 clean_gemini_output 规则相同，但保留的行直接追加到 bytearray，
+    不构建中间列表，也不为去掉结尾分隔符而复制解码后的字符串，降低峰值内存。
+    
+    Args:
+        output: 原始 Gemini CLI 输出（UTF-8 编码）
     
-    cleaned = []
-    for ln in lines:
-        # 跳过仅包含装饰字符的行
-        if set(ln) <= set("-_=*~ ") and len(ln) > 3:
+    Returns:
+        str: 清理后的输出
+    """
+    search = _BOX_CHARS_RE.search if _BOX_CHARS_RE.search(output) is not None else None
+    buf = bytearray()
+    for ln in output.splitlines():
+        ln = ln.strip()
+        if not ln or (len(ln) > 3 and not ln.lstrip(_DECORATION_CHARS)):
             continue
-        # 跳过包含框线字符的行
-        if any(c in ln for c in '█░╭╮╯╰│─┌┐└┘'):
+        if search is not None and search(ln) is not None:
             continue
-        cleaned.append(ln)
+        buf += ln
+        buf += b' '
+    # 去掉最后一个分隔符
+    del buf[-1:]
+    return buf.decode(errors='ignore').strip()
+
+
+def _clean_text(text: str) -> str:
+    """
+    按文本清理 Gemini CLI 输出
+    
+    规则与字节版本相同，但使用 str.strip/splitlines，能识别 Unicode 空白和换行符。
+    
+    Args:
+        text: 已解码的 Gemini CLI 输出
+    
+    Returns:
+        str: 清理后的输出
+    """
+    cleaned = [
+        ln for ln in map(str.strip, text.splitlines())
+        if ln and (len(ln) <= 3 or ln.lstrip(_DECORATION_TEXT))
+    ]
+    
+    if _BOX_CHARS_TEXT_RE.search(text) is not None:
+        search = _BOX_CHARS_TEXT_RE.search
+        cleaned = [ln for ln in cleaned if search(ln) is None]
     
-    return ' '.join(cleaned).strip()
\ No newline at end of file
+    return ' '.join(cleaned).strip()
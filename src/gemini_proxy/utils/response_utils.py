@@ -4,17 +4,69 @@
 提供构建 OpenAI 兼容响应的工具函数。
 """
 
+import itertools
+import logging
+import os
+import re
 import time
-import uuid
-from typing import Dict, Any, List, Optional
+from functools import lru_cache
+from typing import Dict, Any, List, Optional, Tuple
 
-from ..models import (
-    ChatCompletionResponse, 
-    ChatCompletionChoice, 
-    ChatMessage, 
-    ChatCompletionUsage,
-    ChatCompletionChunk
-)
+import orjson
+from fastapi.responses import JSONResponse
+
+try:
+    import tiktoken
+except ImportError:  # 可选依赖，未安装时使用启发式估算
+    tiktoken = None
+
+
+logger = logging.getLogger('gemini-proxy')
+
+# tiktoken 使用的编码，与 OpenAI 聊天模型一致
+_TIKTOKEN_ENCODING = 'cl100k_base'
+
+# 已加载的 tiktoken 编码器，由 load_tokenizer() 在启动时设置
+_encoder = None
+
+# 请求ID前缀：进程启动时间和进程号，保证多个工作进程和重启之间不重复
+_REQUEST_ID_PREFIX = f"{int(time.time()):x}{os.getpid():x}"
+_request_counter = itertools.count(1)
+
+# token 估算使用的字符分类：中文字符、英文单词（至少两个字母）、数字序列
+_CHINESE_CHAR_RE = re.compile(r'[\u4e00-\u9fff]')
+_ENGLISH_WORD_RE = re.compile(r'\b[a-zA-Z]{2,}\b')
+_DIGIT_GROUP_RE = re.compile(r'\b\d+\b')
+
+# token 估算结果缓存的条目数，以及参与缓存的最大文本长度（避免缓存长期持有大字符串）
+_TOKEN_CACHE_SIZE = 4096
+_TOKEN_CACHE_MAX_CHARS = 8192
+
+# 单层花括号或方括号包裹的内容，视为 JSON 片段
+_JSON_RE = re.compile(r'\{[^{}]*\}|\[[^\[\]]*\]')
+
+# 结构化内容中的特殊字符（字母、数字、空白和中文以外的字符）连续片段
+_SPECIAL_RUN_RE = re.compile(r'[^a-zA-Z0-9\s\u4e00-\u9fff]+')
+
+
+def new_request_id() -> str:
+    """
+    生成请求ID
+    
+    请求ID只用于关联日志和响应，不需要随机性，使用进程前缀加自增计数，
+    避免每个请求读取系统随机数。
+    
+    Returns:
+        str: 请求ID
+    """
+    return f"{_REQUEST_ID_PREFIX}{next(_request_counter):08x}"
+
+
+class OrjsonResponse(JSONResponse):
+    """使用 orjson 序列化内容的 JSON 响应"""
+    
+    def render(self, content: Any) -> bytes:
+        return orjson.dumps(content)
 
 
 def build_chat_completion_response(
@@ -22,77 +74,88 @@ def build_chat_completion_response(
     model: str = "gemini-local",
     request_id: Optional[str] = None,
     prompt_tokens: int = 0,
-    completion_tokens: int = 0
-) -> ChatCompletionResponse:
+    completion_tokens: int = 0,
+    created: Optional[int] = None
+) -> Dict[str, Any]:
     """
     构建聊天补全响应
     
+    直接构建与 ChatCompletionResponse 结构一致的字典，响应路径上不经过 Pydantic 校验。
+    
     Args:
         content: 助手回复内容
         model: 模型名称
         request_id: 请求ID，如果为None则自动生成
         prompt_tokens: 提示词token数
         completion_tokens: 补全token数
+        created: 创建时间戳，如果为None则使用当前时间
     
     Returns:
-        ChatCompletionResponse: 聊天补全响应对象
+        Dict: 聊天补全响应字典
     """
     if request_id is None:
-        request_id = f"chatcmpl-{uuid.uuid4().hex}"
+        request_id = f"chatcmpl-{new_request_id()}"
+    if created is None:
+        created = int(time.time())
+    
+    prompt_tokens = max(0, prompt_tokens)
+    completion_tokens = max(0, completion_tokens)
     
-    return ChatCompletionResponse(
-        id=request_id,
-        created=int(time.time()),
-        model=model,
-        system_fingerprint=f"fp_{request_id[:8]}",
-        choices=[
-            ChatCompletionChoice(
-                index=0,
-                message=ChatMessage(
-                    role="assistant",
-                    content=content
-                ),
-                finish_reason="stop"
-            )
+    return {
+        "id": request_id,
+        "object": "chat.completion",
+        "created": created,
+        "model": model,
+        "system_fingerprint": f"fp_{request_id[:8]}",
+        "choices": [
+            {
+                "index": 0,
+                "message": {
+                    "role": "assistant",
+                    "content": content,
+                    "name": None
+                },
+                "finish_reason": "stop"
+            }
         ],
-        usage=ChatCompletionUsage(
-            prompt_tokens=max(0, prompt_tokens),
-            completion_tokens=max(0, completion_tokens),
-            total_tokens=max(0, prompt_tokens + completion_tokens)
-        )
-    )
+        "usage": {
+            "prompt_tokens": prompt_tokens,
+            "completion_tokens": completion_tokens,
+            "total_tokens": prompt_tokens + completion_tokens
+        }
+    }
 
 
-def build_chat_completion_chunk(
-    content: str,
+def build_chunk_frame_affixes(
     request_id: str,
     model: str = "gemini-local",
-    finish_reason: Optional[str] = None
-) -> ChatCompletionChunk:
+    created: Optional[int] = None
+) -> Tuple[bytes, bytes]:
     """
-    构建聊天补全流式响应块
+    预先序列化流式响应块中除内容外的固定部分
+    
+    同一请求的所有响应块只有内容不同，拼接 prefix、JSON 编码的内容和 suffix
+    即得到结构与 ChatCompletionChunk 一致的 SSE 事件。
     
     Args:
-        content: 内容块
         request_id: 请求ID
         model: 模型名称
-        finish_reason: 完成原因，None表示继续
+        created: 创建时间戳，如果为None则使用当前时间
     
     Returns:
-        ChatCompletionChunk: 流式响应块
+        Tuple[bytes, bytes]: SSE 事件的前缀和后缀
     """
-    return ChatCompletionChunk(
-        id=f"chatcmpl-{request_id}",
-        created=int(time.time()),
-        model=model,
-        choices=[
-            {
-                "delta": {"content": content},
-                "index": 0,
-                "finish_reason": finish_reason
-            }
-        ]
+    if created is None:
+        created = int(time.time())
+    
+    prefix = (
+        b'data: {"id":' + orjson.dumps(f"chatcmpl-{request_id}")
+        + b',"object":"chat.completion.chunk","created":' + str(created).encode()
+        + b',"model":' + orjson.dumps(model)
+        + b',"choices":[{"delta":{"content":'
     )
+    suffix = b'},"index":0,"finish_reason":null}]}\n\n'
+    return prefix, suffix
 
 
 def build_error_response(
@@ -121,6 +184,81 @@ def build_error_response(
 
 
 def count_tokens(text: str) -> int:
+    """
+    计算文本的token数量
+
+    安装了 tiktoken 时使用 BPE 编码精确计数，否则使用启发式估算。
+    较短文本的结果会被缓存，重复的提示词（如相同的系统提示）无需重新扫描；
+    可通过 count_tokens.cache_clear() 清空缓存。
+
+    Args:
+        text: 输入文本
+
+    Returns:
+        int: token数量
+    """
+    if len(text) > _TOKEN_CACHE_MAX_CHARS:
+        return _count_tokens_uncached(text)
+    return _count_tokens_cached(text)
+
+
+def load_tokenizer() -> bool:
+    """
+    加载 tiktoken 编码器，进程内只加载一次
+
+    首次加载可能需要下载 BPE 文件，属于阻塞操作，应在应用启动时于线程池中调用；
+    请求路径上不会加载编码器，未加载时使用启发式估算。
+
+    Returns:
+        bool: 编码器是否可用
+    """
+    global _encoder
+    if _encoder is None:
+        _encoder = _get_encoder()
+        # 丢弃加载前缓存的估算结果
+        _count_tokens_cached.cache_clear()
+    return _encoder is not None
+
+
+@lru_cache(maxsize=1)
+def _get_encoder():
+    """
+    创建 tiktoken 编码器
+
+    Returns:
+        tiktoken.Encoding: 编码器，未安装 tiktoken 或加载失败时返回None
+    """
+    if tiktoken is None:
+        return None
+    try:
+        return tiktoken.get_encoding(_TIKTOKEN_ENCODING)
+    except Exception:
+        logger.warning(
+            f"Failed to load tiktoken encoding {_TIKTOKEN_ENCODING}, "
+            f"falling back to estimated token counts"
+        )
+        return None
+
+
+def _count_tokens_uncached(text: str) -> int:
+    """
+    计算文本的token数量（不使用缓存）
+
+    Args:
+        text: 输入文本
+
+    Returns:
+        int: token数量
+    """
+    if not text:
+        return 0
+    if _encoder is None:
+        return _estimate_tokens(text)
+    # 输出中可能出现 <|endoftext|> 等特殊标记的字面文本，按普通文本计数
+    return len(_encoder.encode(text, disallowed_special=()))
+
+
+def _estimate_tokens(text: str) -> int:
     """
     估算文本的token数量
 
@@ -138,33 +276,30 @@ def count_tokens(text: str) -> int:
     if not text:
         return 0
 
-    import re
-
     # 极短文本特殊处理
     if len(text) <= 5:
         return 1
-    elif len(text) <= 15:
+
+    # 统计中文字符（短文本和长文本都需要）
+    chinese_chars = len(_CHINESE_CHAR_RE.findall(text))
+
+    if len(text) <= 15:
         # 短文本按字符密度估算
-        chinese_count = len(re.findall(r'[\u4e00-\u9fff]', text))
-        if chinese_count > len(text) * 0.5:
+        if chinese_chars > len(text) * 0.5:
             # 以中文为主
-            return max(1, chinese_count // 2 + len(text) // 6)
+            return max(1, chinese_chars // 2 + len(text) // 6)
         else:
             # 以英文为主
             return max(1, len(text) // 5)
 
-    # 统计各种类型的字符
-    chinese_chars = len(re.findall(r'[\u4e00-\u9fff]', text))
+    # 英文单词（正则中直接排除单个字符）和数字序列
+    english_words = len(_ENGLISH_WORD_RE.findall(text))
+    digit_groups = len(_DIGIT_GROUP_RE.findall(text))
 
-    # 更精确的英文单词统计（不包括单个字符）
-    english_words = len([w for w in re.findall(r'\b[a-zA-Z]+\b', text) if len(w) > 1])
-
-    # 统计数字序列
-    digit_groups = len(re.findall(r'\b\d+\b', text))
-
-    # 检测结构化内容
-    has_code_blocks = bool(re.search(r'```[\s\S]*?```', text))
-    has_json = bool(re.search(r'\{[^{}]*\}|\[[^\[\]]*\]', text))
+    # 检测结构化内容：代码块需要至少一对 ```，JSON 需要括号，先做廉价的子串判断
+    has_structure = text.count('```') >= 2 or (
+        ('{' in text or '[' in text) and _JSON_RE.search(text) is not None
+    )
 
     # 基础token估算
     chinese_tokens = max(1, chinese_chars // 2)  # 中文：约2字符/token
@@ -173,9 +308,9 @@ def count_tokens(text: str) -> int:
 
     # 结构化内容特殊处理
     structure_tokens = 0
-    if has_code_blocks or has_json:
+    if has_structure:
         # 对代码块和JSON使用更宽松的字符/token比
-        structure_chars = len(re.sub(r'[a-zA-Z0-9\s\u4e00-\u9fff]', '', text))
+        structure_chars = sum(map(len, _SPECIAL_RUN_RE.findall(text)))
         structure_tokens = structure_chars // 6  # 特殊字符密度低
 
     # 组合计算，避免重复计算
@@ -194,4 +329,8 @@ def count_tokens(text: str) -> int:
         final_tokens = int(base_tokens * 0.7 + char_based_tokens * 0.3)
 
     # 确保最小值
-    return max(1, final_tokens)
\ No newline at end of file
+    return max(1, final_tokens)
+
+
+_count_tokens_cached = lru_cache(maxsize=_TOKEN_CACHE_SIZE)(_count_tokens_uncached)
+count_tokens.cache_clear = _count_tokens_cached.cache_clear
\ No newline at end of file
@@ -4,13 +4,39 @@
 提供数据验证和参数校验功能。
 """
 
+import os
 import re
 from typing import List, Dict, Any, Optional
 from fastapi import HTTPException
+from pydantic import TypeAdapter, ValidationError
 
 from ..models import ChatCompletionRequest, ChatMessage
 
 
+# 提示词中需要移除的控制字符（C0 和 C1 控制字符）
+_CTRL_CHARS_RE = re.compile(r'[\x00-\x1f\x7f-\x9f]')
+# ASCII 文本中只可能出现 C0 控制字符和 DEL，用于 bytes.translate 删除
+_CTRL_BYTES = bytes([*range(0x00, 0x20), 0x7f])
+
+# 合法的模型名称：字母、数字、点、下划线和连字符
+_MODEL_NAME_RE = re.compile(r'[a-zA-Z0-9._-]+')
+
+# 非系统消息按角色添加的前缀，未列出的角色会被忽略
+_ROLE_PREFIXES = {
+    'user': 'Human: ',
+    'assistant': 'Assistant: ',
+}
+
+# 提示词中各部分之间的分隔符
+_PART_SEPARATOR = '\n\n'
+
+# 已通过检查的 Gemini CLI 路径
+_verified_gemini_paths = set()
+
+# 聊天请求校验器，模块加载时构建一次，每个请求直接交给 pydantic-core 校验
+_CHAT_REQUEST_ADAPTER = TypeAdapter(ChatCompletionRequest)
+
+
 def validate_chat_request(body: Dict[str, Any]) -> ChatCompletionRequest:
     """
     验证聊天请求数据
@@ -25,59 +51,13 @@ def validate_chat_request(body: Dict[str, Any]) -> ChatCompletionRequest:
         HTTPException: 当验证失败时抛出
     """
     try:
-        # 检查必需字段
-        if not body.get('messages') and not body.get('prompt'):
-            raise HTTPException(
-                status_code=400, 
-                detail='No messages or prompt provided'
-            )
-        
-        # 验证消息格式
-        messages = body.get('messages', [])
-        if messages:
-            if not isinstance(messages, list):
-                raise HTTPException(
-                    status_code=400, 
-                    detail='Messages must be a list'
-                )
-            
-            for msg in messages:
-                if not isinstance(msg, dict):
-                    raise HTTPException(
-                        status_code=400, 
-                        detail='Each message must be an object'
-                    )
-                if 'role' not in msg or 'content' not in msg:
-                    raise HTTPException(
-                        status_code=400, 
-                        detail='Each message must have role and content fields'
-                    )
-        
-        # 验证模型名称
-        model = body.get('model', 'gemini-local')
-        if not isinstance(model, str):
-            raise HTTPException(
-                status_code=400, 
-                detail='Model must be a string'
-            )
-        
-        # 验证流式参数
-        stream = body.get('stream', False)
-        if not isinstance(stream, bool):
-            raise HTTPException(
-                status_code=400, 
-                detail='Stream must be a boolean'
-            )
-        
-        # 创建请求对象
-        return ChatCompletionRequest(**body)
-        
-    except HTTPException:
-        raise
-    except Exception as e:
+        return _CHAT_REQUEST_ADAPTER.validate_python(body)
+    except ValidationError as e:
+        error = e.errors(include_url=False)[0]
+        loc = '.'.join(str(part) for part in error['loc'])
         raise HTTPException(
             status_code=400, 
-            detail=f'Invalid request format: {str(e)}'
+            detail=f"{loc}: {error['msg']}" if loc else error['msg']
         )
 
 
@@ -94,23 +74,32 @@ def validate_prompt(prompt: str) -> str:
     Raises:
         HTTPException: 当提示词无效时抛出
     """
-    if not prompt or not prompt.strip():
+    # 先检查长度，超长的提示词不做任何扫描直接拒绝
+    if len(prompt) > 10000:
         raise HTTPException(
             status_code=400, 
-            detail='Prompt cannot be empty'
+            detail='Prompt too long (max 10000 characters)'
         )
     
-    # 限制提示词长度
-    if len(prompt) > 10000:
+    # 移除潜在的恶意字符：纯 ASCII 文本不含控制字符时直接跳过，否则编码为字节后
+    # 用 bytes.translate 按 256 项删除表过滤；含非 ASCII 字符时正则更快
+    if prompt.isascii():
+        if prompt.isprintable():
+            cleaned = prompt
+        else:
+            cleaned = prompt.encode('ascii').translate(None, _CTRL_BYTES).decode('ascii')
+    else:
+        cleaned = _CTRL_CHARS_RE.sub('', prompt)
+    
+    # 清理后为空（空串、纯空白或只含控制字符）视为空提示词
+    cleaned = cleaned.strip()
+    if not cleaned:
         raise HTTPException(
             status_code=400, 
-            detail='Prompt too long (max 10000 characters)'
+            detail='Prompt cannot be empty'
         )
     
-    # 移除潜在的恶意字符
-    cleaned = re.sub(r'[\x00-\x1f\x7f-\x9f]', '', prompt)
-    
-    return cleaned.strip()
+    return cleaned
 
 
 def validate_model_name(model: str) -> str:
@@ -133,7 +122,7 @@ def validate_model_name(model: str) -> str:
         )
     
     # 检查模型名称格式
-    if not re.match(r'^[a-zA-Z0-9._-]+$', model):
+    if not _MODEL_NAME_RE.fullmatch(model):
         raise HTTPException(
             status_code=400, 
             detail='Invalid model name format'
@@ -161,40 +150,45 @@ def extract_prompt_from_messages(messages: List[ChatMessage]) -> str:
             detail='No messages provided'
         )
     
-    parts = []
-    system_messages = [m for m in messages if m.role == 'system']
-    
-    if system_messages:
-        system_content = '\n'.join(m.content for m in system_messages)
-        parts.append('System: ' + system_content)
-    
+    # 单次遍历：系统消息单独收集，最后合并后放在最前面。
+    # 前缀、内容和分隔符作为独立片段收集，最后一次 join 完成拼接，
+    # 避免为每条（可能很长的）消息内容先复制出一个带前缀的中间字符串
+    segments = []
+    system_parts = []
     for message in messages:
         role = message.role
-        content = message.content
-        
-        if role == 'user':
-            parts.append('Human: ' + content)
-        elif role == 'assistant':
-            parts.append('Assistant: ' + content)
+        if role == 'system':
+            system_parts.append(message.content)
+        elif prefix := _ROLE_PREFIXES.get(role):
+            segments += (_PART_SEPARATOR, prefix, message.content)
+    
+    if system_parts:
+        segments[0:0] = (_PART_SEPARATOR, 'System: ', '\n'.join(system_parts))
     
     # 如果最后一条消息是用户消息，添加助手提示
-    if messages and messages[-1].role == 'user':
-        parts.append('Assistant:')
+    if messages[-1].role == 'user':
+        segments += (_PART_SEPARATOR, 'Assistant:')
     
-    return '\n\n'.join(parts)
+    # 去掉开头多出的分隔符
+    del segments[:1]
+    return ''.join(segments)
 
 
 def validate_gemini_path(gemini_path: str) -> None:
     """
     验证 Gemini CLI 路径
     
+    通过检查的路径会被记住，之后的调用不再访问文件系统；
+    未通过的路径每次都会重新检查，安装 CLI 后无需重启即可生效。
+    
     Args:
         gemini_path: Gemini CLI 路径
     
     Raises:
         HTTPException: 当路径无效时抛出
     """
-    import os
+    if gemini_path in _verified_gemini_paths:
+        return
     
     if not os.path.exists(gemini_path):
         raise HTTPException(
@@ -206,4 +200,11 @@ def validate_gemini_path(gemini_path: str) -> None:
         raise HTTPException(
             status_code=500, 
             detail=f'Gemini CLI is not executable at {gemini_path}'
-        )
\ No newline at end of file
+        )
+    
+    _verified_gemini_paths.add(gemini_path)
+
+
+def clear_gemini_path_cache() -> None:
+    """清除已验证的 Gemini CLI 路径（CLI 被移除或替换后调用）"""
+    _verified_gemini_paths.clear()
\ No newline at end of file